@@ -96,11 +96,12 @@ async def get_today_attendance(
 ):
     """Get today's attendance logs"""
     try:
-        logs = attendance_service.get_today_attendance(db)
+        today = datetime.now().date()
+        logs = attendance_service.get_today_attendance(db, today)
         
         return {
             "success": True,
-            "date": datetime.now().date().isoformat(),
+            "date": today.isoformat(),
             "total": len(logs),
             "logs": logs
         }
@@ -202,12 +203,14 @@ async def check_in_status(
     Returns: not-checked-in or checked-in (check-out updates continuously)
     """
     try:
-        status_today = attendance_service.get_attendance_status_today(db, employee_id)
-        has_checked_in = attendance_service.has_checked_in_today(db, employee_id)
-        
-        # Get today's attendance record to show check-out time
+        # Resolve today once for every lookup in this request
         from datetime import date
         today = date.today()
+        
+        status_today = attendance_service.get_attendance_status_today(db, employee_id, today)
+        has_checked_in = attendance_service.has_checked_in_today(db, employee_id, today)
+        
+        # Get today's attendance record to show check-out time
         attendance = db.query(attendance_service.__class__.__module__).first()  # Get AttendanceLog
         from app.models.attendance import AttendanceLog
         attendance_record = db.query(AttendanceLog).filter(
@@ -7,7 +7,6 @@ from sqlalchemy.orm import Session
 import cv2
 import numpy as np
 import base64
-import json
 import time
 import asyncio
 from typing import Optional
@@ -168,16 +167,17 @@ async def register_face(
         cv2.imwrite(image_path, frame)
         
         # Update employee embeddings
-        current_embeddings = json.loads(employee.embeddings) if employee.embeddings else []
-        current_embeddings.append(embedding.tolist())
+        current_embeddings = employee_service.decode_embeddings(
+            employee.embeddings_blob, employee.embeddings
+        )
+        all_embeddings = np.vstack([current_embeddings, embedding.reshape(1, -1)])
         
-        employee.embeddings = json.dumps(current_embeddings)
-        employee.total_embeddings = len(current_embeddings)
+        employee.embeddings_blob = employee_service.encode_embeddings(all_embeddings)
+        employee.total_embeddings = len(all_embeddings)
         
         # Calculate mean embedding
-        all_embeddings = np.array(current_embeddings)
         mean_embedding = np.mean(all_embeddings, axis=0)
-        employee.mean_embedding = json.dumps(mean_embedding.tolist())
+        employee.mean_embedding_blob = employee_service.encode_embeddings(mean_embedding)
         
         db.commit()
         db.refresh(employee)
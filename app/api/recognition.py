@@ -21,7 +21,7 @@ from app.models.schemas import (
 )
 from app.services.face_recognition import face_service
 from app.services.employee import employee_service
-from app.services.attendance import attendance_service
+from app.services.attendance import attendance_batcher
 from app.services.camera import camera_service
 
 router = APIRouter(prefix="/recognition", tags=["recognition"])
@@ -58,6 +58,7 @@ async def recognize_faces(
         
         # Convert to response format
         recognized_faces = []
+        attendance_futures = []
         for result in results:
             employee_code = result['employee_code']
             
@@ -75,11 +76,14 @@ async def recognize_faces(
                 ))
                 
                 # Log attendance - automatically handles check-in or check-out
-                attendance_record, action = attendance_service.log_attendance(
-                    db=db,
-                    employee_id=employee.id
-                )
-                logger.info(f"🔔 {action.upper()}: {employee.full_name}")
+                attendance_futures.append((employee, attendance_batcher.submit(employee.id)))
+        
+        # Every face was queued first, so they all land in the same batch window
+        outcomes = await asyncio.gather(
+            *(asyncio.wrap_future(future) for _, future in attendance_futures)
+        )
+        for (employee, _), (attendance_record, action) in zip(attendance_futures, outcomes):
+            logger.info(f"🔔 {action.upper()}: {employee.full_name}")
         
         processing_time = (datetime.now() - start_time).total_seconds()
         
@@ -148,6 +152,7 @@ async def websocket_recognition_stream(
                     if not frame_queue.empty():
                         frame = frame_queue.get(timeout=0.1)
                         temp_results = []
+                        attendance_futures = []
                         
                         # Detect faces
                         faces = face_service.detect_faces(frame)
@@ -185,14 +190,9 @@ async def websocket_recognition_stream(
                                         temp_results.append(result)
                                         
                                         # Log attendance - continuously update check-out
-                                        try:
-                                            attendance_record, action = attendance_service.log_attendance(
-                                                db=db,
-                                                employee_id=employee.id
-                                            )
-                                            logger.info(f"🔔 {action.upper()}: {employee.full_name}")
-                                        except Exception as att_error:
-                                            logger.error(f"Error logging attendance: {att_error}")
+                                        attendance_futures.append(
+                                            (employee, attendance_batcher.submit(employee.id))
+                                        )
                                 else:
                                     # Unknown face (confidence < 80%)
                                     result = {
@@ -213,6 +213,14 @@ async def websocket_recognition_stream(
                         with results_lock:
                             latest_results.clear()
                             latest_results.extend(temp_results)
+                        
+                        # All faces were queued together - wait for the shared flush
+                        for employee, future in attendance_futures:
+                            try:
+                                attendance_record, action = future.result()
+                                logger.info(f"🔔 {action.upper()}: {employee.full_name}")
+                            except Exception as att_error:
+                                logger.error(f"Error logging attendance: {att_error}")
                     else:
                         time.sleep(0.01)  # Use time.sleep, not await
                         
@@ -36,7 +36,7 @@ async def get_system_status(
         total_employees = employee_service.count_employees(db, status='active')
         
         # Check model status
-        model_loaded = face_service.model_loaded and face_service.svm_model is not None
+        model_loaded = face_service.model_loaded
         insightface_loaded = face_service.app is not None
         
         # Check camera
@@ -1,9 +1,10 @@
 """
 Database connection and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from loguru import logger
 from .config import settings
 
 # Create SQLAlchemy engine
@@ -34,6 +35,53 @@ def get_db():
 
 def init_db():
     """
-    Initialize database - create all tables
+    Initialize database - create all tables and upgrade existing ones
     """
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+
+def migrate_db():
+    """
+    Apply schema changes that create_all() cannot (safe to run repeatedly)
+    
+    create_all() only creates missing tables - columns and indexes added
+    to existing models are brought in here.
+    """
+    inspector = inspect(engine)
+    
+    # Composite indexes declared in the models' __table_args__
+    indexes = (
+        ("attendance", "ix_attendance_employee_work_date", "employee_id, work_date"),
+        ("employee", "ix_employee_status_code", "status, employee_code"),
+    )
+    
+    with engine.begin() as conn:
+        for table, name, columns in indexes:
+            if not inspector.has_table(table):
+                continue
+            if name not in {index["name"] for index in inspector.get_indexes(table)}:
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+                logger.info(f"✅ Created index {table}.{name}")
+        
+        # Raw float16 embedding blobs (legacy JSON columns stay as fallback)
+        if inspector.has_table("employee"):
+            columns = {column["name"] for column in inspector.get_columns("employee")}
+            for name in ("embeddings_blob", "mean_embedding_blob"):
+                if name not in columns:
+                    conn.execute(text(f"ALTER TABLE employee ADD COLUMN {name} MEDIUMBLOB"))
+                    logger.info(f"✅ Added column employee.{name}")
+        
+        # total_hours used to be written by the app - now a stored generated column
+        if inspector.has_table("attendance"):
+            extra = conn.execute(text(
+                "SELECT EXTRA FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'attendance' "
+                "AND COLUMN_NAME = 'total_hours'"
+            )).scalar()
+            if extra is not None and "GENERATED" not in extra.upper():
+                conn.execute(text(
+                    "ALTER TABLE attendance MODIFY total_hours FLOAT AS "
+                    "(ROUND(TIMESTAMPDIFF(SECOND, check_in, check_out) / 3600, 2)) STORED"
+                ))
+                logger.info("✅ Converted attendance.total_hours to a generated column")
@@ -1,7 +1,7 @@
 """
 Attendance log database model
 """
-from sqlalchemy import Column, Integer, String, DateTime, Date, Float, ForeignKey, Text
+from sqlalchemy import Column, Computed, Index, Integer, String, DateTime, Date, Float, ForeignKey, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -9,15 +9,22 @@ from app.core.database import Base
 
 class AttendanceLog(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        Index("ix_attendance_employee_work_date", "employee_id", "work_date"),
+    )
     
-    # SQLite compatible schema
+    # MySQL schema (total_hours is a generated column)
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     employee_id = Column(Integer, ForeignKey("employee.id"), nullable=False, index=True)
     camera_id = Column(Integer)
     work_date = Column(Date)
     check_in = Column(DateTime)
     check_out = Column(DateTime)
-    total_hours = Column(Float)
+    # Maintained by the database from check_in/check_out (MySQL generated column)
+    total_hours = Column(
+        Float,
+        Computed("ROUND(TIMESTAMPDIFF(SECOND, check_in, check_out) / 3600, 2)", persisted=True)
+    )
     status = Column(String(20))  # 'checked-in', 'completed', 'pending'
     notes = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
@@ -1,13 +1,16 @@
 """
 Employee database model
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, LargeBinary, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
 
 class Employee(Base):
     __tablename__ = "employee"
+    __table_args__ = (
+        Index("ix_employee_status_code", "status", "employee_code"),
+    )
     
     # SQLite compatible schema
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -22,8 +25,10 @@ class Employee(Base):
     department_id = Column(Integer)
     
     # Face recognition fields
-    embeddings = Column(Text)  # JSON array of embeddings
-    mean_embedding = Column(Text)  # Mean embedding
+    embeddings = Column(Text)  # Legacy JSON array of embeddings (read-only fallback)
+    mean_embedding = Column(Text)  # Legacy JSON mean embedding (read-only fallback)
+    embeddings_blob = Column(LargeBinary(length=2**24 - 1))  # Raw float16 (N, D) embeddings
+    mean_embedding_blob = Column(LargeBinary(length=2**24 - 1))  # Raw float16 (D,) mean embedding
     image_paths = Column(Text)  # JSON array of image paths
     total_embeddings = Column(Integer, default=0)
     registration_video_path = Column(String(500))
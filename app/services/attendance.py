@@ -1,16 +1,35 @@
 """
 Attendance Service for logging and querying attendance records
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func, and_
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from concurrent.futures import Future
+from queue import Queue, Empty
+import threading
+import time
 from loguru import logger
 
+from app.core.config import settings
+from app.core.database import SessionLocal
 from app.models.attendance import AttendanceLog
 from app.models.employee import Employee
 
 
+# (date, monotonic timestamp) of the last datetime.now() lookup
+_today_cache: list = [None, 0.0]
+
+
+def _today_cached() -> date:
+    """Return today's date, re-reading the clock at most once per second"""
+    t = time.monotonic()
+    if _today_cache[0] is None or t - _today_cache[1] > 1.0:
+        _today_cache[0] = datetime.now().date()
+        _today_cache[1] = t
+    return _today_cache[0]
+
+
 class AttendanceService:
     """
     Service for attendance logging and statistics
@@ -47,6 +66,31 @@ class AttendanceService:
             )
         ).first()
         
+        attendance, action = AttendanceService._apply_attendance(
+            db, existing, employee_id, camera_id, today, now
+        )
+        
+        db.commit()
+        db.refresh(attendance)
+        
+        AttendanceService._log_action(attendance, action, now)
+        return attendance, action
+    
+    @staticmethod
+    def _apply_attendance(
+        db: Session,
+        existing: Optional[AttendanceLog],
+        employee_id: int,
+        camera_id: Optional[int],
+        today,
+        now: datetime
+    ) -> tuple[AttendanceLog, str]:
+        """
+        Apply a check-in / check-out to the session without committing
+        
+        Returns:
+            Tuple of (AttendanceLog object, action: 'check-in' or 'check-out')
+        """
         if not existing:
             # First time today - CREATE new record with check-in
             attendance = AttendanceLog(
@@ -56,28 +100,22 @@ class AttendanceService:
                 check_in=now,
                 status="checked-in"
             )
-            
             db.add(attendance)
-            db.commit()
-            db.refresh(attendance)
-            
-            logger.info(f"✅ CHECK-IN: employee_id {employee_id} at {now.strftime('%H:%M:%S')}")
             return attendance, "check-in"
-            
+        
+        # Has check-in - ALWAYS UPDATE check-out (continuous update)
+        # total_hours is a generated column, recomputed by the database
+        existing.check_out = now
+        existing.status = "completed"
+        return existing, "check-out"
+    
+    @staticmethod
+    def _log_action(attendance: AttendanceLog, action: str, now: datetime):
+        """Log a committed check-in / check-out"""
+        if action == "check-in":
+            logger.info(f"✅ CHECK-IN: employee_id {attendance.employee_id} at {now.strftime('%H:%M:%S')}")
         else:
-            # Has check-in - ALWAYS UPDATE check-out (continuous update)
-            existing.check_out = now
-            
-            # Calculate total hours
-            time_diff = existing.check_out - existing.check_in
-            existing.total_hours = round(time_diff.total_seconds() / 3600, 2)
-            existing.status = "completed"
-            
-            db.commit()
-            db.refresh(existing)
-            
-            logger.info(f"🔄 CHECK-OUT UPDATED: employee_id {employee_id} at {now.strftime('%H:%M:%S')} (Total: {existing.total_hours}h)")
-            return existing, "check-out"
+            logger.info(f"🔄 CHECK-OUT UPDATED: employee_id {attendance.employee_id} at {now.strftime('%H:%M:%S')} (Total: {attendance.total_hours}h)")
     
     @staticmethod
     def get_attendance_logs(
@@ -102,16 +140,9 @@ class AttendanceService:
         Returns:
             List of AttendanceLog objects
         """
-        query = db.query(AttendanceLog)
-        
-        if employee_id:
-            query = query.filter(AttendanceLog.employee_id == employee_id)
-        
-        if start_date:
-            query = query.filter(AttendanceLog.check_in >= start_date)
-        
-        if end_date:
-            query = query.filter(AttendanceLog.check_in <= end_date)
+        # Load employees in one extra IN query instead of one per row
+        query = db.query(AttendanceLog).options(selectinload(AttendanceLog.employee))
+        query = AttendanceService._apply_log_filters(query, employee_id, start_date, end_date)
         
         return query.order_by(AttendanceLog.check_in.desc()).offset(skip).limit(limit).all()
     
@@ -124,22 +155,45 @@ class AttendanceService:
     ) -> int:
         """Count attendance logs with filters"""
         query = db.query(AttendanceLog)
+        query = AttendanceService._apply_log_filters(query, employee_id, start_date, end_date)
+        
+        return query.count()
+    
+    @staticmethod
+    def _apply_log_filters(
+        query,
+        employee_id: Optional[int] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ):
+        """
+        Apply shared attendance log filters
         
+        Date bounds are also applied to the indexed work_date column so the
+        (employee_id, work_date) index can be used for range queries.
+        """
         if employee_id:
             query = query.filter(AttendanceLog.employee_id == employee_id)
         
         if start_date:
-            query = query.filter(AttendanceLog.check_in >= start_date)
+            query = query.filter(
+                AttendanceLog.work_date >= start_date.date(),
+                AttendanceLog.check_in >= start_date
+            )
         
         if end_date:
-            query = query.filter(AttendanceLog.check_in <= end_date)
+            query = query.filter(
+                AttendanceLog.work_date <= end_date.date(),
+                AttendanceLog.check_in <= end_date
+            )
         
-        return query.count()
+        return query
     
     @staticmethod
-    def get_today_attendance(db: Session) -> List[AttendanceLog]:
+    def get_today_attendance(db: Session, today: Optional[date] = None) -> List[AttendanceLog]:
         """Get today's attendance logs"""
-        today = datetime.now().date()
+        if today is None:
+            today = _today_cached()
         
         return db.query(AttendanceLog).filter(
             AttendanceLog.work_date == today
@@ -185,18 +239,24 @@ class AttendanceService:
         }
     
     @staticmethod
-    def has_checked_in_today(db: Session, employee_id: int) -> bool:
+    def has_checked_in_today(
+        db: Session,
+        employee_id: int,
+        today: Optional[date] = None
+    ) -> bool:
         """
         Check if employee has already checked in today
         
         Args:
             db: Database session
             employee_id: Employee ID
+            today: Date to check (defaults to today)
             
         Returns:
             True if already checked in
         """
-        today = datetime.now().date()
+        if today is None:
+            today = _today_cached()
         
         attendance = db.query(AttendanceLog).filter(
             and_(
@@ -208,18 +268,24 @@ class AttendanceService:
         return attendance is not None and attendance.check_in is not None
     
     @staticmethod
-    def get_attendance_status_today(db: Session, employee_id: int) -> str:
+    def get_attendance_status_today(
+        db: Session,
+        employee_id: int,
+        today: Optional[date] = None
+    ) -> str:
         """
         Get attendance status for today
         
         Args:
             db: Database session
             employee_id: Employee ID
+            today: Date to check (defaults to today)
             
         Returns:
             'not-checked-in' or 'checked-in' (with continuous check-out updates)
         """
-        today = datetime.now().date()
+        if today is None:
+            today = _today_cached()
         
         attendance = db.query(AttendanceLog).filter(
             and_(
@@ -234,4 +300,128 @@ class AttendanceService:
             return "checked-in"  # Always "checked-in" after first recognition
 
 
+class AttendanceBatcher:
+    """
+    Coalesces concurrent attendance writes into one commit per tick
+    
+    Recognition events for the same employee arriving within the same
+    window collapse into a single check-in / check-out update, so N
+    cameras seeing one person cost one write instead of N.
+    """
+    
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._queue: Queue = Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def submit(self, employee_id: int, camera_id: Optional[int] = None) -> Future:
+        """
+        Queue an attendance event
+        
+        Args:
+            employee_id: Employee ID
+            camera_id: Camera ID used for recognition
+            
+        Returns:
+            Future resolving to (AttendanceLog object, action)
+        """
+        self._ensure_started()
+        
+        future: Future = Future()
+        self._queue.put((employee_id, camera_id, datetime.now(), future))
+        return future
+    
+    def _ensure_started(self):
+        """Start the consumer thread on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        """Consumer loop - drain one window of events and flush them"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            
+            self._flush(batch)
+    
+    def _flush(self, batch: List[tuple]):
+        """Write one batch of events with a single commit"""
+        # Group by employee and work date (taken from each event's own
+        # timestamp, so a batch straddling midnight hits both days' rows),
+        # keeping the latest timestamp per key
+        grouped: Dict[Tuple[int, date], dict] = {}
+        for employee_id, camera_id, now, future in batch:
+            entry = grouped.setdefault((employee_id, now.date()), {
+                "camera_id": camera_id,
+                "now": now,
+                "futures": []
+            })
+            entry["now"] = max(entry["now"], now)
+            entry["futures"].append(future)
+        
+        db = SessionLocal()
+        try:
+            employee_ids = {employee_id for employee_id, _ in grouped}
+            work_dates = {work_date for _, work_date in grouped}
+            
+            existing_rows = db.query(AttendanceLog).filter(
+                and_(
+                    AttendanceLog.employee_id.in_(list(employee_ids)),
+                    AttendanceLog.work_date.in_(list(work_dates))
+                )
+            ).all()
+            existing_by_key = {(row.employee_id, row.work_date): row for row in existing_rows}
+            
+            applied = {}
+            for key, entry in grouped.items():
+                employee_id, work_date = key
+                applied[key] = AttendanceService._apply_attendance(
+                    db,
+                    existing_by_key.get(key),
+                    employee_id,
+                    entry["camera_id"],
+                    work_date,
+                    entry["now"]
+                )
+            
+            db.commit()
+            
+            for key, (attendance, action) in applied.items():
+                db.refresh(attendance)
+                AttendanceService._log_action(attendance, action, grouped[key]["now"])
+            
+            # Detach so callers can read the rows after the session closes
+            db.expunge_all()
+            
+            for key, entry in grouped.items():
+                for future in entry["futures"]:
+                    future.set_result(applied[key])
+                    
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error flushing attendance batch: {e}")
+            for entry in grouped.values():
+                for future in entry["futures"]:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            db.close()
+
+
 attendance_service = AttendanceService()
+attendance_batcher = AttendanceBatcher(interval=settings.ATTENDANCE_BATCH_INTERVAL)
@@ -4,10 +4,12 @@ Manages multi-angle face capture for employee registration
 """
 import os
 import time
+from pathlib import Path
 import cv2
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from cachetools import TTLCache
 from loguru import logger
 
 from app.services.head_pose import head_pose_estimator
@@ -15,6 +17,13 @@ from app.services.head_pose import head_pose_estimator
 # Configure OpenCV to use 4 threads for optimized performance
 cv2.setNumThreads(4)
 
+# JPEG encode parameters for captured pose images
+_JPEG_PARAMS = (
+    cv2.IMWRITE_JPEG_QUALITY, 92,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0
+)
+
 
 class AutoRegistrationSession:
     """
@@ -27,6 +36,12 @@ class AutoRegistrationSession:
     # Number of frames to hold pose before capturing
     HOLD_FRAMES = 15  # ~0.5 seconds at 30fps
     
+    # Margin (pixels) added around the face bbox when saving a capture
+    CROP_MARGIN = 50
+    
+    # Bbox IoU above which the previous head pose is reused while holding
+    POSE_REUSE_IOU = 0.97
+    
     def __init__(self, employee_code: str, storage_path: str):
         """
         Initialize registration session
@@ -48,9 +63,13 @@ class AutoRegistrationSession:
         self.stable_frames = 0
         self.last_guidance = ""
         
-        # Create storage directory
+        # Last measured head pose and the bbox it was measured on
+        self._last_bbox: Optional[List[int]] = None
+        self._last_pose: Optional[Tuple[float, float, float]] = None
+        
+        # Create storage directory (employee dir is created by the service)
         self.session_dir = os.path.join(storage_path, employee_code, self.session_id)
-        os.makedirs(self.session_dir, exist_ok=True)
+        Path(self.session_dir).mkdir(exist_ok=True)
         
         logger.info(f"Auto registration session started: {self.session_id}")
     
@@ -96,9 +115,23 @@ class AutoRegistrationSession:
                 "guidance": "Registration complete!"
             }
         
-        # Calculate head pose
         h, w = frame.shape[:2]
-        yaw, pitch, roll, success = head_pose_estimator.get_head_pose(landmarks, w, h)
+        
+        # While holding a good pose, a face that has not moved keeps its pose
+        if (
+            self.stable_frames > 0
+            and self._last_pose is not None
+            and self._bbox_iou(face_bbox, self._last_bbox) > self.POSE_REUSE_IOU
+        ):
+            yaw, pitch, roll = self._last_pose
+            success = True
+        else:
+            # Calculate head pose
+            yaw, pitch, roll, success = head_pose_estimator.get_head_pose(landmarks, w, h)
+            
+            if success:
+                self._last_bbox = face_bbox
+                self._last_pose = (yaw, pitch, roll)
         
         if not success:
             return {
@@ -130,8 +163,18 @@ class AutoRegistrationSession:
                 should_capture = True
                 self.stable_frames = 0
                 
+                # Crop to face region (with margin) using the known frame size
+                x1, y1, x2, y2 = face_bbox
+                margin = self.CROP_MARGIN
+                crop_bbox = (
+                    max(0, x1 - margin),
+                    max(0, y1 - margin),
+                    min(w, x2 + margin),
+                    min(h, y2 + margin)
+                )
+                
                 # Save image
-                image_path = self._save_frame(frame, face_bbox)
+                image_path = self._save_frame(frame, crop_bbox)
                 self.captured_poses[self.current_target_pose] = image_path
                 
                 # Move to next pose
@@ -181,13 +224,13 @@ class AutoRegistrationSession:
                 "target_pose": self.current_target_pose
             }
     
-    def _save_frame(self, frame: np.ndarray, face_bbox: List[int]) -> str:
+    def _save_frame(self, frame: np.ndarray, crop_bbox: Tuple[int, int, int, int]) -> str:
         """
         Save captured frame
         
         Args:
             frame: Video frame
-            face_bbox: Face bounding box
+            crop_bbox: Face bounding box with margin, clipped to the frame
             
         Returns:
             Path to saved image
@@ -196,27 +239,43 @@ class AutoRegistrationSession:
         filename = f"{self.current_target_pose}_{timestamp}.jpg"
         filepath = os.path.join(self.session_dir, filename)
         
-        # Optionally crop to face region (with margin)
-        x1, y1, x2, y2 = face_bbox
-        margin = 50
-        h, w = frame.shape[:2]
-        x1 = max(0, x1 - margin)
-        y1 = max(0, y1 - margin)
-        x2 = min(w, x2 + margin)
-        y2 = min(h, y2 + margin)
+        x1, y1, x2, y2 = crop_bbox
         
-        face_crop = frame[y1:y2, x1:x2]
+        # Single contiguous copy of the crop, encoded in memory
+        face_crop = np.ascontiguousarray(frame[y1:y2, x1:x2])
+        success, buffer = cv2.imencode(".jpg", face_crop, _JPEG_PARAMS)
+        if not success:
+            raise RuntimeError(f"Failed to encode {self.current_target_pose} pose image")
         
-        # Save full frame and cropped face
-        cv2.imwrite(filepath, face_crop)
+        buffer.tofile(filepath)
         
         logger.info(f"Saved {self.current_target_pose} pose: {filepath}")
         return filepath
     
+    @staticmethod
+    def _bbox_iou(box_a: List[int], box_b: List[int]) -> float:
+        """Intersection over union of two [x1, y1, x2, y2] boxes"""
+        ix1 = max(box_a[0], box_b[0])
+        iy1 = max(box_a[1], box_b[1])
+        ix2 = min(box_a[2], box_b[2])
+        iy2 = min(box_a[3], box_b[3])
+        
+        inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+        if inter == 0:
+            return 0.0
+        
+        area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+        area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+        return inter / float(area_a + area_b - inter)
+    
     def _advance_to_next_pose(self):
         """Move to next required pose"""
         self.current_pose_index += 1
         
+        # Cached pose belongs to the previous target
+        self._last_bbox = None
+        self._last_pose = None
+        
         if self.current_pose_index < len(self.REQUIRED_POSES):
             self.current_target_pose = self.REQUIRED_POSES[self.current_pose_index]
             logger.info(f"Advanced to pose: {self.current_target_pose}")
@@ -232,14 +291,40 @@ class AutoRegistrationSession:
         logger.info(f"Cleaning up session: {self.session_id}")
 
 
+class _SessionCache(TTLCache):
+    """
+    TTL cache that cleans up sessions it evicts or expires
+    """
+    
+    def popitem(self):
+        key, session = super().popitem()
+        session.cleanup()
+        return key, session
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, session in expired:
+            session.cleanup()
+        return expired
+
+
 class AutoRegistrationService:
     """
     Service to manage auto registration sessions
     """
     
-    def __init__(self, storage_path: str = "./app/storage/employee_images"):
+    def __init__(
+        self,
+        storage_path: str = "./app/storage/employee_images",
+        max_sessions: int = 1024,
+        session_ttl: int = 600
+    ):
         self.storage_path = storage_path
-        self.active_sessions: Dict[str, AutoRegistrationSession] = {}
+        # Abandoned sessions are dropped after session_ttl seconds
+        self.active_sessions: Dict[str, AutoRegistrationSession] = _SessionCache(
+            maxsize=max_sessions,
+            ttl=session_ttl
+        )
     
     def start_session(self, employee_code: str) -> AutoRegistrationSession:
         """
@@ -255,6 +340,8 @@ class AutoRegistrationService:
         if employee_code in self.active_sessions:
             self.end_session(employee_code)
         
+        Path(self.storage_path, employee_code).mkdir(parents=True, exist_ok=True)
+        
         session = AutoRegistrationSession(employee_code, self.storage_path)
         self.active_sessions[employee_code] = session
         
@@ -3,8 +3,12 @@ Camera Service for real-time face recognition with multiprocessing
 """
 import cv2
 import numpy as np
-from typing import Optional, Dict, List, Callable
-from multiprocessing import Process, Queue, Manager, Event
+from typing import Optional, Dict, List, Callable, Tuple
+from multiprocessing import Process, Queue, Event, Value, shared_memory
+from queue import Empty, Full, Queue as StageQueue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+import os
+import threading
 import time
 from datetime import datetime
 from loguru import logger
@@ -21,6 +25,12 @@ class CameraService:
     Uses multiprocessing for optimal performance (60 FPS)
     """
     
+    # Number of shared memory frame slots handed to the AI worker
+    SHM_SLOTS = 4
+    
+    # Maximum frames recognized together by the AI worker
+    RECOGNITION_BATCH = 4
+    
     def __init__(self, camera_id: int = 0):
         self.camera_id = camera_id
         self.cap: Optional[cv2.VideoCapture] = None
@@ -29,53 +39,109 @@ class CameraService:
         # Multiprocessing components
         self.frame_queue: Optional[Queue] = None
         self.result_queue: Optional[Queue] = None
-        self.recognized_dict = None
         self.stop_event: Optional[Event] = None
         self.ai_process: Optional[Process] = None
+        
+        # Shared memory frame ring (slot index travels over frame_queue)
+        self.shm_slots: List[shared_memory.SharedMemory] = []
+        self.free_slots: Optional[Queue] = None
+        
+        # Frames handed to the worker and not yet processed (backpressure)
+        self._inflight: Optional[Value] = None
+        
+        # Employees recognized in the current stream (filled from result_queue)
+        self._recognized_local: Dict[str, Dict] = {}
+        self._on_recognition: Optional[Callable] = None
+        
+        # Analysis cadence (monotonic) - independent of the display rate
+        self.predict_interval = 1.0
+        self._last_submit_ts = 0.0
+        
+        # Capture thread - owns the device and keeps only the latest frame
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._latest: Optional[Tuple[np.ndarray, float]] = None
+        
+        # Two decode buffers reused by retrieve(); _latest always points at
+        # the one not being written
+        self._buffers: List[Optional[np.ndarray]] = [None, None]
+        self._write_index = 0
     
     @staticmethod
-    def list_available_cameras(max_cameras: int = 10) -> List[Dict]:
+    def list_available_cameras(max_cameras: int = 10, timeout: float = 5.0) -> List[Dict]:
         """
         List all available cameras on the system
         
+        Devices are probed in parallel threads; probes still running after
+        the timeout are abandoned.
+        
         Args:
             max_cameras: Maximum number of cameras to check
+            timeout: Maximum seconds to wait for all probes
             
         Returns:
             List of camera information dictionaries
         """
         available_cameras = []
         
-        for camera_id in range(max_cameras):
-            try:
-                cap = cv2.VideoCapture(camera_id, cv2.CAP_DSHOW)
-                if not cap.isOpened():
-                    cap = cv2.VideoCapture(camera_id)
-                
-                if cap.isOpened():
-                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                    fps = int(cap.get(cv2.CAP_PROP_FPS))
-                    backend = cap.getBackendName()
-                    
-                    available_cameras.append({
-                        "id": camera_id,
-                        "name": f"Camera {camera_id}",
-                        "width": width,
-                        "height": height,
-                        "fps": fps if fps > 0 else 30,
-                        "backend": backend
-                    })
-                    
-                    cap.release()
-                    logger.info(f"Found camera {camera_id}: {width}x{height}")
-                    
-            except Exception as e:
-                logger.debug(f"Camera {camera_id} not available: {e}")
-                continue
+        executor = ThreadPoolExecutor(max_workers=max_cameras)
+        try:
+            futures = [
+                executor.submit(CameraService._probe_camera, camera_id)
+                for camera_id in range(max_cameras)
+            ]
+            for future in as_completed(futures, timeout=timeout):
+                info = future.result()
+                if info is not None:
+                    available_cameras.append(info)
+        except FuturesTimeout:
+            logger.warning(f"Camera probing timed out after {timeout}s")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
+        available_cameras.sort(key=lambda camera: camera["id"])
         return available_cameras
     
+    @staticmethod
+    def _probe_camera(camera_id: int) -> Optional[Dict]:
+        """
+        Open a camera device and read its properties
+        
+        Args:
+            camera_id: Camera device index
+            
+        Returns:
+            Camera information dictionary, or None if not available
+        """
+        try:
+            cap = cv2.VideoCapture(camera_id, cv2.CAP_DSHOW)
+            if not cap.isOpened():
+                cap = cv2.VideoCapture(camera_id)
+            
+            if not cap.isOpened():
+                return None
+            
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = int(cap.get(cv2.CAP_PROP_FPS))
+            backend = cap.getBackendName()
+            cap.release()
+            
+            logger.info(f"Found camera {camera_id}: {width}x{height}")
+            return {
+                "id": camera_id,
+                "name": f"Camera {camera_id}",
+                "width": width,
+                "height": height,
+                "fps": fps if fps > 0 else 30,
+                "backend": backend
+            }
+            
+        except Exception as e:
+            logger.debug(f"Camera {camera_id} not available: {e}")
+            return None
+    
     def switch_camera(self, new_camera_id: int) -> bool:
         """
         Switch to a different camera
@@ -87,10 +153,8 @@ class CameraService:
             Success status
         """
         try:
-            # Close current camera
-            if self.cap is not None:
-                self.cap.release()
-                self.cap = None
+            # Close current camera (stops the capture thread first)
+            self.close_camera()
             
             # Update camera ID
             self.camera_id = new_camera_id
@@ -110,8 +174,10 @@ class CameraService:
             return False
     
     def open_camera(self) -> bool:
-        """Open camera device"""
+        """Open camera device and start the capture thread"""
         try:
+            self._stop_capture_thread()
+            
             self.cap = cv2.VideoCapture(self.camera_id, cv2.CAP_DSHOW)
             
             if not self.cap.isOpened():
@@ -128,8 +194,17 @@ class CameraService:
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
             # Warm up camera
+            frame = None
             for _ in range(10):
-                self.cap.read()
+                ret, frame = self.cap.read()
+            
+            # Seed the latest frame so readers never wait on the thread
+            with self._frame_lock:
+                self._latest = (frame, time.monotonic()) if frame is not None else None
+            
+            self._capture_stop.clear()
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
             
             logger.info(f"✅ Camera {self.camera_id} opened successfully")
             return True
@@ -140,21 +215,62 @@ class CameraService:
     
     def close_camera(self):
         """Close camera device"""
+        self._stop_capture_thread()
+        
         if self.cap is not None:
             self.cap.release()
             self.cap = None
             logger.info("Camera closed")
+        
+        with self._frame_lock:
+            self._latest = None
     
-    def read_frame(self) -> Optional[np.ndarray]:
-        """Read a single frame from camera"""
-        if self.cap is None or not self.cap.isOpened():
-            return None
+    def _stop_capture_thread(self):
+        """Stop the capture thread before the device is released or replaced"""
+        if self._capture_thread is not None:
+            self._capture_stop.set()
+            self._capture_thread.join(timeout=1.0)
+            self._capture_thread = None
+    
+    def _capture_loop(self):
+        """
+        Capture thread - grab every frame, decode at most CAMERA_FPS per second
         
-        ret, frame = self.cap.read()
-        if not ret:
-            return None
+        Blocking device I/O happens here so request handlers only ever
+        pick up the latest decoded frame.
+        """
+        decode_interval = 1.0 / settings.CAMERA_FPS
+        last_retrieve = 0.0
+        self._buffers = [None, None]
+        self._write_index = 0
         
-        return frame
+        while not self._capture_stop.is_set():
+            cap = self.cap
+            if cap is None or not cap.grab():
+                time.sleep(0.01)
+                continue
+            
+            now = time.monotonic()
+            if now - last_retrieve < decode_interval:
+                continue
+            
+            # Decode into the back buffer (reallocated only if the size changes)
+            ret, frame = cap.retrieve(self._buffers[self._write_index])
+            if ret:
+                self._buffers[self._write_index] = frame
+                with self._frame_lock:
+                    self._latest = (frame, now)
+                self._write_index ^= 1
+                last_retrieve = now
+    
+    def read_frame(self) -> Optional[np.ndarray]:
+        """
+        Return a copy of the latest frame from the capture thread (non-blocking)
+        
+        The capture buffers are reused, so callers get their own copy.
+        """
+        with self._frame_lock:
+            return self._latest[0].copy() if self._latest is not None else None
     
     def get_camera_info(self) -> Dict:
         """Get camera information"""
@@ -173,68 +289,199 @@ class CameraService:
     def ai_recognition_worker(
         frame_queue: Queue,
         result_queue: Queue,
-        recognized_dict,
+        free_slots: Queue,
+        slot_names: List[str],
+        inflight: Value,
         stop_event: Event,
-        threshold: float,
-        callback: Optional[Callable] = None
+        threshold: float
     ):
         """
         AI recognition worker process (runs in separate process)
         
+        Runs detection in the process main loop and hands batches to an
+        embedding thread and a matching thread through bounded queues.
+        
         Args:
-            frame_queue: Queue to receive frames
+            frame_queue: Queue to receive frame slot references
             result_queue: Queue to send results
-            recognized_dict: Shared dictionary for recognized employees
+            free_slots: Queue to return frame slots to once processed
+            slot_names: Shared memory names of the frame slots
+            inflight: Shared counter of frames not yet processed
             stop_event: Event to stop the worker
             threshold: Recognition threshold
-            callback: Optional callback function for each recognition
         """
+        # Keep the worker off the capture/web cores (Linux only)
+        # (ONNX Runtime's thread count is sized to these cores when the
+        # sessions are created - see FaceRecognitionService._load_insightface)
+        if settings.AI_WORKER_CPUS:
+            try:
+                os.sched_setaffinity(0, set(settings.AI_WORKER_CPUS))
+            except (AttributeError, OSError) as e:
+                logger.warning(f"Could not pin AI worker to CPUs {settings.AI_WORKER_CPUS}: {e}")
+        
+        if settings.AI_WORKER_NICE:
+            try:
+                os.nice(settings.AI_WORKER_NICE)
+            except (AttributeError, OSError) as e:
+                logger.warning(f"Could not change AI worker niceness: {e}")
+        
         # Import inside worker to avoid pickling issues
         from app.services.face_recognition import face_service
+        face_service._warmup()
         
         logger.info("🤖 AI Recognition Process Started")
         
+        # Attach to the frame slots once for the lifetime of the worker
+        slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+        
+        # Codes already published in this stream (throttles new_rec events;
+        # the main process is the authority via setdefault)
+        seen = set()
+        
+        # Pipeline: detect (this loop) -> embed thread -> match thread.
+        # ONNX Runtime releases the GIL, so detection of the next batch
+        # overlaps embedding of the previous one.
+        detected: StageQueue = StageQueue(maxsize=2)
+        embedded: StageQueue = StageQueue(maxsize=2)
+        
+        def forward(stage_queue: StageQueue, item) -> None:
+            """Hand an item to the next stage, giving up once stopped"""
+            while not stop_event.is_set():
+                try:
+                    stage_queue.put(item, timeout=0.5)
+                    return
+                except Full:
+                    continue
+        
+        def embed_stage() -> None:
+            while not stop_event.is_set():
+                try:
+                    item = detected.get(timeout=0.5)
+                except Empty:
+                    continue
+                
+                try:
+                    face_service.embed_faces(item['faces'], item['crops'])
+                    del item['crops']
+                    forward(embedded, item)
+                except Exception as e:
+                    logger.error(f"AI worker embed error: {e}")
+        
+        def match_stage() -> None:
+            while not stop_event.is_set():
+                try:
+                    item = embedded.get(timeout=0.5)
+                except Empty:
+                    continue
+                
+                try:
+                    publish(item)
+                except Exception as e:
+                    logger.error(f"AI worker match error: {e}")
+        
+        def publish(item: Dict) -> None:
+            batch = item['batch']
+            batch_results = [
+                face_service.match_faces(faces, threshold) for faces in item['faces']
+            ]
+            
+            # Map bboxes from the downscaled frame back to camera pixels
+            for frame_data, results in zip(batch, batch_results):
+                scale_x, scale_y = frame_data['scale']
+                if scale_x == 1.0 and scale_y == 1.0:
+                    continue
+                for r in results:
+                    x1, y1, x2, y2 = r['bbox']
+                    r['bbox'] = [
+                        int(x1 * scale_x), int(y1 * scale_y),
+                        int(x2 * scale_x), int(y2 * scale_y)
+                    ]
+            
+            process_start = item['process_start']
+            process_time = (time.time() - process_start) * 1000 / len(batch)
+            
+            # One timestamp per batch, shared by every face in it
+            ts_iso = datetime.fromtimestamp(process_start).isoformat()
+            
+            # Send results back per frame
+            for frame_data, results in zip(batch, batch_results):
+                result_queue.put({
+                    'type': 'results',
+                    'frame_id': frame_data['id'],
+                    'results': results,
+                    'process_time': process_time,
+                    'num_faces': len(results)
+                })
+            
+            # Publish first recognition of each employee
+            for result in (r for results in batch_results for r in results):
+                employee_code = result['employee_code']
+                if employee_code == "Unknown" or employee_code in seen:
+                    continue
+                
+                seen.add(employee_code)
+                result_queue.put({
+                    'type': 'new_rec',
+                    'code': employee_code,
+                    'data': {
+                        'timestamp': ts_iso,
+                        'confidence': result['confidence_score'],
+                        'method': result['method']
+                    },
+                    'result': result
+                })
+                
+                logger.info(f"✅ Recognized: {employee_code} ({result['confidence_score']:.3f})")
+        
+        stages = [
+            threading.Thread(target=embed_stage, daemon=True),
+            threading.Thread(target=match_stage, daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        
         try:
             while not stop_event.is_set():
                 try:
-                    if not frame_queue.empty():
-                        frame_data = frame_queue.get(timeout=0.1)
-                        frame = frame_data['frame']
-                        frame_id = frame_data['id']
-                        
-                        process_start = time.time()
-                        
-                        # Recognize faces in frame
-                        results = face_service.recognize_faces_in_frame(frame, threshold)
-                        
-                        process_time = (time.time() - process_start) * 1000
-                        
-                        # Send results back
-                        result_queue.put({
-                            'frame_id': frame_id,
-                            'results': results,
-                            'process_time': process_time,
-                            'num_faces': len(results)
-                        })
-                        
-                        # Update recognized dictionary
-                        for result in results:
-                            employee_code = result['employee_code']
-                            if employee_code not in recognized_dict:
-                                recognized_dict[employee_code] = {
-                                    'timestamp': datetime.now().isoformat(),
-                                    'confidence': result['confidence_score'],
-                                    'method': result['method']
-                                }
-                                
-                                # Execute callback if provided
-                                if callback:
-                                    callback(result)
-                                
-                                logger.info(f"✅ Recognized: {employee_code} ({result['confidence_score']:.3f})")
+                    # Block on the queue pipe; stop_event is checked on timeout
+                    try:
+                        batch = [frame_queue.get(timeout=0.5)]
+                    except Empty:
+                        continue
+                    
+                    # Take whatever else is already queued (no waiting)
+                    while len(batch) < CameraService.RECOGNITION_BATCH:
+                        try:
+                            batch.append(frame_queue.get_nowait())
+                        except Empty:
+                            break
+                    
+                    process_start = time.time()
+                    
+                    # Detect on zero-copy views; slots are free once crops are cut
+                    try:
+                        frames = [
+                            np.ndarray(
+                                frame_data['shape'],
+                                dtype=np.uint8,
+                                buffer=slots[frame_data['slot']].buf
+                            )
+                            for frame_data in batch
+                        ]
+                        faces, crops = face_service.detect_and_align(frames)
+                        del frames
+                    finally:
+                        for frame_data in batch:
+                            free_slots.put(frame_data['slot'])
+                        with inflight.get_lock():
+                            inflight.value -= len(batch)
                     
-                    else:
-                        time.sleep(0.01)
+                    forward(detected, {
+                        'batch': batch,
+                        'faces': faces,
+                        'crops': crops,
+                        'process_start': process_start
+                    })
                         
                 except Exception as e:
                     logger.error(f"AI worker error: {e}")
@@ -242,6 +489,12 @@ class CameraService:
                     
         except Exception as e:
             logger.error(f"AI worker fatal error: {e}")
+        finally:
+            stop_event.set()
+            for stage in stages:
+                stage.join(timeout=1.0)
+            for shm in slots:
+                shm.close()
         
         logger.info("🛑 AI Recognition Process Stopped")
     
@@ -257,7 +510,7 @@ class CameraService:
         Args:
             threshold: Recognition threshold
             predict_interval: Interval between predictions (seconds)
-            on_recognition: Callback function for each recognition
+            on_recognition: Callback for each newly recognized employee (runs in this process)
             
         Returns:
             Success status
@@ -268,11 +521,26 @@ class CameraService:
         if not self.open_camera():
             return False
         
+        self.predict_interval = predict_interval
+        self._last_submit_ts = 0.0
+        
+        # Allocate the shared memory frame ring at camera resolution
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or settings.CAMERA_WIDTH
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or settings.CAMERA_HEIGHT
+        self.shm_slots = [
+            shared_memory.SharedMemory(create=True, size=width * height * 3)
+            for _ in range(self.SHM_SLOTS)
+        ]
+        self.free_slots = Queue()
+        for slot in range(self.SHM_SLOTS):
+            self.free_slots.put(slot)
+        self._inflight = Value('i', 0)
+        
         # Create multiprocessing components
-        manager = Manager()
         self.frame_queue = Queue(maxsize=2)
         self.result_queue = Queue(maxsize=5)
-        self.recognized_dict = manager.dict()
+        self._recognized_local = {}
+        self._on_recognition = on_recognition
         self.stop_event = Event()
         
         # Start AI process
@@ -281,10 +549,11 @@ class CameraService:
             args=(
                 self.frame_queue,
                 self.result_queue,
-                self.recognized_dict,
+                self.free_slots,
+                [shm.name for shm in self.shm_slots],
+                self._inflight,
                 self.stop_event,
-                threshold,
-                on_recognition
+                threshold
             ),
             daemon=True
         )
@@ -307,6 +576,14 @@ class CameraService:
                 self.ai_process.terminate()
                 self.ai_process.join()
         
+        # Release the shared memory frame ring
+        for shm in self.shm_slots:
+            shm.close()
+            shm.unlink()
+        self.shm_slots = []
+        self.free_slots = None
+        self._inflight = None
+        
         self.close_camera()
         logger.info("Recognition stream stopped")
     
@@ -317,12 +594,27 @@ class CameraService:
         """
         Get frame with recognition results
         
+        Display and analysis run at separate rates: the latest captured
+        frame is returned on every call, while a frame is submitted for
+        recognition at most every predict_interval seconds and only when
+        the worker has capacity.
+        
         Args:
             send_for_recognition: Whether to send frame for recognition
             
         Returns:
             Dictionary with frame and recognition results
         """
+        if self.cap is None or not self.cap.isOpened():
+            return None
+        
+        now = time.monotonic()
+        recognition_due = (
+            send_for_recognition
+            and self.frame_queue is not None
+            and now - self._last_submit_ts >= self.predict_interval
+        )
+        
         frame = self.read_frame()
         if frame is None:
             return None
@@ -334,19 +626,36 @@ class CameraService:
         }
         
         # Send frame for recognition
-        if send_for_recognition and self.frame_queue:
-            if self.frame_queue.qsize() < 2:
+        if recognition_due:
+            # Reserve an in-flight slot atomically (qsize() is unreliable)
+            with self._inflight.get_lock():
+                submit = self._inflight.value < 2
+                if submit:
+                    self._inflight.value += 1
+            
+            if submit:
                 frame_id = int(time.time() * 1000)
-                self.frame_queue.put({
-                    'frame': frame.copy(),
-                    'id': frame_id
-                })
+                if self._submit_frame(self._downscale(frame), frame_id, frame.shape):
+                    self._last_submit_ts = now
+                else:
+                    with self._inflight.get_lock():
+                        self._inflight.value -= 1
         
         # Get recognition results
         if self.result_queue:
             while not self.result_queue.empty():
                 try:
                     recognition_data = self.result_queue.get_nowait()
+                    
+                    if recognition_data['type'] == 'new_rec':
+                        data = recognition_data['data']
+                        first = self._recognized_local.setdefault(recognition_data['code'], data) is data
+                        
+                        # Execute callback on first recognition only
+                        if first and self._on_recognition:
+                            self._on_recognition(recognition_data['result'])
+                        continue
+                    
                     result['results'] = recognition_data['results']
                     result['process_time'] = recognition_data['process_time']
                 except:
@@ -354,11 +663,65 @@ class CameraService:
         
         return result
     
+    @staticmethod
+    def _downscale(frame: np.ndarray) -> np.ndarray:
+        """Shrink a frame to DETECTION_WIDTH (no-op if already that small)"""
+        height, width = frame.shape[:2]
+        if width <= settings.DETECTION_WIDTH:
+            return frame
+        
+        new_height = int(height * settings.DETECTION_WIDTH / width)
+        return cv2.resize(
+            frame,
+            (settings.DETECTION_WIDTH, new_height),
+            interpolation=cv2.INTER_AREA
+        )
+    
+    def _submit_frame(
+        self,
+        frame: np.ndarray,
+        frame_id: int,
+        source_shape: Optional[Tuple[int, ...]] = None
+    ) -> bool:
+        """
+        Copy a frame into a free shared memory slot and hand it to the worker
+        
+        Only the slot index, frame id, shape and bbox scale go through the queue.
+        
+        Args:
+            frame: Frame to recognize (possibly downscaled)
+            frame_id: Frame identifier
+            source_shape: Shape of the camera frame the bboxes map back to
+            
+        Returns:
+            False if no slot was free (frame dropped)
+        """
+        try:
+            slot = self.free_slots.get_nowait()
+        except Empty:
+            return False
+        
+        shm = self.shm_slots[slot]
+        if frame.nbytes > shm.size:
+            logger.warning(f"Frame {frame.shape} does not fit in shared memory slot")
+            self.free_slots.put(slot)
+            return False
+        
+        if source_shape is None:
+            source_shape = frame.shape
+        
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[:] = frame
+        self.frame_queue.put({
+            'slot': slot,
+            'id': frame_id,
+            'shape': frame.shape,
+            'scale': (source_shape[1] / frame.shape[1], source_shape[0] / frame.shape[0])
+        })
+        return True
+    
     def get_recognized_employees(self) -> Dict:
         """Get dictionary of recognized employees"""
-        if self.recognized_dict is None:
-            return {}
-        return dict(self.recognized_dict)
+        return dict(self._recognized_local)
 
 
 # Global instance
@@ -1,12 +1,15 @@
 """
 Employee Service for database operations
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, load_only
 from typing import List, Optional
-import json
+import numpy as np
+import orjson
 from datetime import datetime
 from loguru import logger
 
+from app.core.config import settings
 from app.models.employee import Employee
 from app.models.schemas import EmployeeCreate, EmployeeUpdate
 from app.services.face_recognition import face_service
@@ -38,10 +41,10 @@ class EmployeeService:
         Returns:
             Created Employee object
         """
-        # Convert embeddings to JSON
-        embeddings_json = json.dumps(embeddings)
-        mean_embedding_json = json.dumps(mean_embedding)
-        image_paths_json = json.dumps(image_paths) if image_paths else None
+        # Store embeddings as raw float16 bytes
+        embeddings_blob = EmployeeService.encode_embeddings(embeddings)
+        mean_embedding_blob = EmployeeService.encode_embeddings(mean_embedding)
+        image_paths_json = orjson.dumps(image_paths).decode() if image_paths else None
         
         # Create employee
         db_employee = Employee(
@@ -50,8 +53,8 @@ class EmployeeService:
             email=employee_data.email,
             phone_number=employee_data.phone_number,
             position=employee_data.position,
-            embeddings=embeddings_json,
-            mean_embedding=mean_embedding_json,
+            embeddings_blob=embeddings_blob,
+            mean_embedding_blob=mean_embedding_blob,
             image_paths=image_paths_json,
             total_embeddings=len(embeddings),
             status="active"
@@ -63,11 +66,40 @@ class EmployeeService:
         
         logger.info(f"Created employee: {employee_data.employee_code} - {employee_data.full_name}")
         
-        # Update face recognition service
-        face_service.load_employee_db()
+        # Update face recognition service incrementally
+        if embeddings is not None and len(embeddings) > 0:
+            face_service.add_employee(
+                db_employee.employee_code,
+                EmployeeService.decode_embeddings(embeddings_blob),
+                EmployeeService.decode_embeddings(mean_embedding_blob).reshape(-1)
+            )
         
         return db_employee
     
+    @staticmethod
+    def encode_embeddings(embeddings) -> Optional[bytes]:
+        """Serialize embeddings to raw float16 bytes (None if empty)"""
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        return np.ascontiguousarray(embeddings, dtype=np.float16).tobytes()
+    
+    @staticmethod
+    def decode_embeddings(blob: Optional[bytes], legacy_json: Optional[str] = None) -> np.ndarray:
+        """
+        Deserialize embeddings to a float32 (N, D) array
+        
+        Falls back to the legacy JSON column for rows written before the
+        binary columns existed.
+        """
+        if blob:
+            embeddings = np.frombuffer(blob, dtype=np.float16)
+        elif legacy_json:
+            embeddings = np.asarray(orjson.loads(legacy_json), dtype=np.float32)
+        else:
+            embeddings = np.empty(0, dtype=np.float32)
+        
+        return embeddings.reshape(-1, settings.EMBEDDING_DIM).astype(np.float32)
+    
     @staticmethod
     def get_employee(db: Session, employee_id: int) -> Optional[Employee]:
         """Get employee by ID"""
@@ -86,7 +118,22 @@ class EmployeeService:
         status: Optional[str] = None
     ) -> List[Employee]:
         """Get list of employees"""
-        query = db.query(Employee)
+        # Skip the embedding/image columns - list views never need them
+        query = db.query(Employee).options(load_only(
+            Employee.id,
+            Employee.employee_code,
+            Employee.full_name,
+            Employee.email,
+            Employee.phone_number,
+            Employee.position,
+            Employee.base_salary,
+            Employee.standard_work_days,
+            Employee.department_id,
+            Employee.status,
+            Employee.total_embeddings,
+            Employee.created_at,
+            Employee.updated_at
+        ))
         
         if status is not None:
             query = query.filter(Employee.status == status)
@@ -96,12 +143,12 @@ class EmployeeService:
     @staticmethod
     def count_employees(db: Session, status: Optional[str] = None) -> int:
         """Count total employees"""
-        query = db.query(Employee)
+        query = db.query(func.count(Employee.id))
         
         if status is not None:
             query = query.filter(Employee.status == status)
         
-        return query.count()
+        return query.scalar()
     
     @staticmethod
     def update_employee(
@@ -142,8 +189,8 @@ class EmployeeService:
         
         logger.info(f"Deleted employee: {db_employee.employee_code}")
         
-        # Reload face recognition database
-        face_service.load_employee_db()
+        # Drop the employee from the face recognition database
+        face_service.remove_employee(db_employee.employee_code)
         
         return True
     
@@ -152,21 +199,32 @@ class EmployeeService:
         """
         Rebuild face recognition database from MySQL database
         """
-        employees = db.query(Employee).filter(Employee.status == "active").all()
-        
-        face_service.employee_db = {}
-        
-        for employee in employees:
+        # Only the columns needed - avoids hydrating full Employee objects
+        rows = db.query(
+            Employee.employee_code,
+            Employee.embeddings_blob,
+            Employee.mean_embedding_blob,
+            Employee.embeddings,
+            Employee.mean_embedding
+        ).filter(Employee.status == "active").yield_per(512)
+        
+        employee_db = {}
+        
+        for employee_code, embeddings_blob, mean_blob, embeddings_json, mean_json in rows:
             try:
-                embeddings = json.loads(employee.embeddings)
-                mean_embedding = json.loads(employee.mean_embedding)
+                embeddings = EmployeeService.decode_embeddings(embeddings_blob, embeddings_json)
+                mean_embedding = EmployeeService.decode_embeddings(mean_blob, mean_json).reshape(-1)
                 
-                face_service.employee_db[employee.employee_code] = {
+                employee_db[employee_code] = {
                     "all": embeddings,
                     "mean": mean_embedding
                 }
             except Exception as e:
-                logger.error(f"Error loading embeddings for {employee.employee_code}: {e}")
+                logger.error(f"Error loading embeddings for {employee_code}: {e}")
+        
+        face_service.employee_db = employee_db
+        face_service._build_mean_index()
+        face_service._build_stacked_index()
         
         face_service._save_employee_db()
         logger.info(f"Rebuilt face database: {len(face_service.employee_db)} employees")
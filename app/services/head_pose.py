@@ -2,9 +2,10 @@
 Head Pose Estimation Service
 Calculates yaw, pitch, roll from facial landmarks
 """
+import math
 import numpy as np
 import cv2
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 from loguru import logger
 
 # Configure OpenCV to use 4 threads for optimized performance
@@ -16,7 +17,10 @@ class HeadPoseEstimator:
     Estimate head pose (yaw, pitch, roll) from facial landmarks
     """
     
-    def __init__(self):
+    def __init__(self, closed_form_5pt: bool = True):
+        # 5-point landmarks use the closed-form estimate instead of solvePnP
+        self.closed_form_5pt = closed_form_5pt
+        
         # 3D model points of facial landmarks (generic face model)
         self.model_points = np.array([
             (0.0, 0.0, 0.0),             # Nose tip
@@ -27,6 +31,35 @@ class HeadPoseEstimator:
             (150.0, -150.0, -125.0)      # Right mouth corner
         ], dtype=np.float64)
         
+        # Camera intrinsics per image size (constant for a camera stream)
+        self._cam_cache: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        
+    def _build_cam(self, image_width: int, image_height: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Build and cache the approximate camera matrix and distortion coefficients
+        
+        Args:
+            image_width: Image width
+            image_height: Image height
+            
+        Returns:
+            Tuple of (camera_matrix, dist_coeffs)
+        """
+        # Camera matrix (approximate intrinsic parameters)
+        focal_length = image_width
+        center = (image_width / 2, image_height / 2)
+        camera_matrix = np.array([
+            [focal_length, 0, center[0]],
+            [0, focal_length, center[1]],
+            [0, 0, 1]
+        ], dtype=np.float64)
+        
+        # Assume no lens distortion
+        dist_coeffs = np.zeros((4, 1))
+        
+        self._cam_cache[(image_width, image_height)] = (camera_matrix, dist_coeffs)
+        return camera_matrix, dist_coeffs
+        
     def get_head_pose(
         self, 
         landmarks: np.ndarray,
@@ -52,17 +85,15 @@ class HeadPoseEstimator:
             # Check if landmarks is None or empty
             if landmarks is None or len(landmarks) == 0:
                 return 0.0, 0.0, 0.0, False
-            # Camera matrix (approximate intrinsic parameters)
-            focal_length = image_width
-            center = (image_width / 2, image_height / 2)
-            camera_matrix = np.array([
-                [focal_length, 0, center[0]],
-                [0, focal_length, center[1]],
-                [0, 0, 1]
-            ], dtype=np.float64)
-            
-            # Assume no lens distortion
-            dist_coeffs = np.zeros((4, 1))
+            
+            if len(landmarks) == 5 and self.closed_form_5pt:
+                yaw, pitch, roll = self._pose_from_5_points(landmarks)
+                return yaw, pitch, roll, True
+            
+            camera_matrix, dist_coeffs = (
+                self._cam_cache.get((image_width, image_height))
+                or self._build_cam(image_width, image_height)
+            )
             
             # Select 6 key points from landmarks
             # InsightFace landmarks typically: 5 points or 106/68 points
@@ -114,36 +145,74 @@ class HeadPoseEstimator:
             logger.error(f"Error calculating head pose: {e}")
             return 0.0, 0.0, 0.0, False
     
+    @staticmethod
+    def _pose_from_5_points(landmarks: np.ndarray) -> Tuple[float, float, float]:
+        """
+        Closed-form weak-perspective head pose from 5 keypoints
+        
+        With 5 points solvePnP is degenerate (the chin has to be
+        approximated by the nose), so the angles are taken directly from
+        the eye/nose/mouth geometry instead of an iterative solve.
+        
+        Args:
+            landmarks: 5-point landmarks (left_eye, right_eye, nose, left_mouth, right_mouth)
+            
+        Returns:
+            Tuple of (yaw, pitch, roll) in degrees
+        """
+        left_eye, right_eye, nose, left_mouth, right_mouth = (
+            np.asarray(landmarks, dtype=np.float64)[:, :2]
+        )
+        
+        eye_mid = (left_eye + right_eye) / 2
+        mouth_mid = (left_mouth + right_mouth) / 2
+        face_mid = (eye_mid + mouth_mid) / 2
+        
+        eye_dx, eye_dy = right_eye - left_eye
+        eye_dist = np.hypot(eye_dx, eye_dy)
+        face_height = np.hypot(*(mouth_mid - eye_mid))
+        if eye_dist < 1e-6 or face_height < 1e-6:
+            return 0.0, 0.0, 0.0
+        
+        # Roll: tilt of the eye line
+        roll = np.arctan2(eye_dy, eye_dx)
+        
+        # Yaw: nose offset from the eye midpoint across the face
+        # (subject turning right moves the nose towards image left)
+        yaw = np.arcsin(np.clip(2 * (eye_mid[0] - nose[0]) / eye_dist, -1.0, 1.0))
+        
+        # Pitch: nose offset from the face midpoint (looking up moves it up)
+        pitch = np.arcsin(np.clip(2 * (face_mid[1] - nose[1]) / face_height, -1.0, 1.0))
+        
+        return float(np.degrees(yaw)), float(np.degrees(pitch)), float(np.degrees(roll))
+    
     def _rotation_matrix_to_euler_angles(self, R: np.ndarray) -> Tuple[float, float, float]:
         """
         Convert rotation matrix to Euler angles (yaw, pitch, roll)
         
+        One 3x3 matrix per face - scalar math avoids NumPy ufunc overhead.
+        
         Args:
             R: 3x3 rotation matrix
             
         Returns:
             Tuple of (yaw, pitch, roll) in degrees
         """
-        # Calculate yaw (rotation around Y-axis)
-        sy = np.sqrt(R[0, 0] * R[0, 0] + R[1, 0] * R[1, 0])
+        r00, r10, r11, r12 = float(R[0, 0]), float(R[1, 0]), float(R[1, 1]), float(R[1, 2])
+        r20, r21, r22 = float(R[2, 0]), float(R[2, 1]), float(R[2, 2])
         
-        singular = sy < 1e-6
+        # Calculate yaw (rotation around Y-axis)
+        sy = math.hypot(r00, r10)
         
-        if not singular:
-            yaw = np.arctan2(R[1, 0], R[0, 0])
-            pitch = np.arctan2(-R[2, 0], sy)
-            roll = np.arctan2(R[2, 1], R[2, 2])
+        if sy >= 1e-6:
+            yaw = math.atan2(r10, r00)
+            roll = math.atan2(r21, r22)
         else:
-            yaw = np.arctan2(-R[1, 2], R[1, 1])
-            pitch = np.arctan2(-R[2, 0], sy)
-            roll = 0
-        
-        # Convert to degrees
-        yaw = np.degrees(yaw)
-        pitch = np.degrees(pitch)
-        roll = np.degrees(roll)
+            yaw = math.atan2(-r12, r11)
+            roll = 0.0
+        pitch = math.atan2(-r20, sy)
         
-        return yaw, pitch, roll
+        return math.degrees(yaw), math.degrees(pitch), math.degrees(roll)
     
     def is_pose_acceptable(
         self,
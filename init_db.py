@@ -1,16 +1,16 @@
 """
 Database initialization and sample data script
 """
-from app.core.database import engine, Base, SessionLocal
+from app.core.database import SessionLocal, init_db
 from app.models.employee import Employee
 from app.models.attendance import AttendanceLog
 from loguru import logger
 
 
 def init_database():
-    """Create all database tables"""
+    """Create all database tables and upgrade existing ones"""
     logger.info("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     logger.info("✅ Database tables created successfully")
 
 
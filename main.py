@@ -1,146 +1,359 @@
 """
 Main FastAPI application
 """
-from fastapi import FastAPI, Request
+import asyncio
+import hashlib
+import importlib
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from contextlib import asynccontextmanager
+from pathlib import Path
+from fastapi import Depends, FastAPI, Request, Response
+from fastapi.dependencies.utils import is_async_gen_callable, is_coroutine_callable, is_gen_callable
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.routing import Mount, Route
 from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from typing import Dict, Tuple
+import orjson
 import sys
 import os
 
 from app.core.config import settings
 from app.core.database import init_db
-from app.api import recognition, auto_registration, employees, head_pose
-from app.services.face_recognition import face_service
 
-# Configure loguru
-logger.remove()
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>",
-    level="INFO"
+# API routers - imported at startup (they pull in InsightFace/ONNX Runtime/sklearn)
+API_ROUTERS = ("employees", "auto_registration", "recognition", "head_pose")
+
+# Configure logging - loguru only enqueues records, a background
+# QueueListener thread does the formatting and stdout/file I/O
+Path("logs").mkdir(exist_ok=True)
+log_formatter = logging.Formatter(
+    "%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
 )
-logger.add(
-    "logs/app_{time:YYYY-MM-DD}.log",
-    rotation="00:00",
-    retention="30 days",
-    level="DEBUG"
+stdout_handler = logging.StreamHandler(sys.stdout)
+stdout_handler.setLevel(logging.INFO)
+stdout_handler.setFormatter(log_formatter)
+file_handler = TimedRotatingFileHandler(
+    "logs/app.log", when="midnight", backupCount=30, encoding="utf-8"
 )
+file_handler.setLevel(settings.LOG_LEVEL)
+file_handler.setFormatter(log_formatter)
 
-# Create FastAPI app
-app = FastAPI(
-    title=settings.PROJECT_NAME,
-    description="Face Recognition Attendance System with FastAPI",
-    version="1.0.0",
-    debug=settings.DEBUG
-)
 
-# Mount static files and templates
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of growing memory when the queue is full"""
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+# Bounded - a slow disk or stdout pipe cannot grow memory without limit
+log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+log_handler = DroppingQueueHandler(log_queue)
+log_listener = QueueListener(log_queue, stdout_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+
+logger.remove()
+# Loguru drops calls below LOG_LEVEL before building a record
+logger.add(log_handler, format="{message}", level=settings.LOG_LEVEL, catch=True)
+
+
+def _restart_log_listener():
+    """Forked children (the camera AI worker) need their own queue and listener thread"""
+    global log_listener
+    
+    # The parent's queue locks may have been held at fork time
+    log_handler.queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    log_listener = QueueListener(
+        log_handler.queue, stdout_handler, file_handler, respect_handler_level=True
+    )
+    log_listener.start()
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize on startup"""
+# POSIX only - Windows spawns child processes, which re-run this module
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_log_listener)
+
+
+# Set once the employee index and classifier are loaded (see _load_models)
+models_ready = asyncio.Event()
+
+
+async def wait_for_models():
+    """Hold API requests until the background model load has finished"""
+    await models_ready.wait()
+
+
+async def _load_models(face_service):
+    """Load the employee index and classifier in worker threads, then open the API"""
+    try:
+        # Independent loaders - run them concurrently
+        await asyncio.gather(
+            asyncio.to_thread(face_service.load_employee_db),
+            asyncio.to_thread(face_service.load_svm_model)
+        )
+        logger.info("✅ Face recognition models loaded")
+    except Exception as e:
+        logger.error(f"❌ Model loading error: {e}")
+    finally:
+        models_ready.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize on startup, cleanup on shutdown"""
     logger.info("🚀 Starting Face Recognition System...")
     
     try:
-        # Initialize database
-        init_db()
+        # Heavy modules are only imported by a serving process, not by `import main`
+        from app.services.face_recognition import face_service
+        for name in API_ROUTERS:
+            router = importlib.import_module(f"app.api.{name}").router
+            app.include_router(
+                router,
+                prefix=settings.API_V1_PREFIX,
+                dependencies=[Depends(wait_for_models)]
+            )
+        _check_async_routes()
+        
+        # Models pre-warm in the background while pages and the health
+        # check are already served; API routes wait on models_ready
+        app.state.model_task = asyncio.create_task(_load_models(face_service))
+        
+        await asyncio.to_thread(init_db)
         logger.info("✅ Database initialized")
         
-        # Load face recognition models
-        face_service.load_employee_db()
-        face_service.load_svm_model()
-        logger.info("✅ Face recognition models loaded")
+        _render_pages()
         
         logger.info(f"🎉 System ready! Running on {settings.HOST}:{settings.PORT}")
         
     except Exception as e:
         logger.error(f"❌ Startup error: {e}")
         raise
+    
+    yield
+    
+    logger.info("🛑 Shutting down Face Recognition System...")
+    
+    # Flush queued log records
+    log_listener.stop()
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    logger.info("🛑 Shutting down Face Recognition System...")
-    # Add cleanup tasks here if needed
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers keep content-versioned assets for a year"""
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        
+        # ?v=<hash> URLs (see static_url) change whenever the file does
+        if b"v=" in scope.get("query_string", b""):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+def static_url(path: str) -> str:
+    """Static asset URL versioned by a hash of the file content"""
+    digest = hashlib.sha1(Path("app/static", path).read_bytes()).hexdigest()[:12]
+    return f"/static/{path}?v={digest}"
+
+
+# Templates - compiled once and kept; files are only re-stat'ed while developing
+templates = Jinja2Templates(directory="app/templates", auto_reload=settings.DEBUG, cache_size=-1)
+templates.env.globals["static_url"] = static_url
+
+# HTML pages have no per-request content - rendered once at startup
+PAGES = ("index.html", "registration.html", "recognition.html", "employees.html")
+page_cache: Dict[str, Tuple[bytes, str]] = {}
+
+
+def _render_page(name: str) -> Tuple[bytes, str]:
+    """Render one page and compute its ETag"""
+    body = templates.get_template(name).render(request=None).encode("utf-8")
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def _render_pages():
+    """Render every page once and store its body with an ETag"""
+    for name in PAGES:
+        page_cache[name] = _render_page(name)
+
+
+def _page_response(request: Request, name: str) -> Response:
+    """Serve a pre-rendered page, or 304 if the client already has it"""
+    if settings.DEBUG:
+        # Render per request so template edits show up without a restart
+        body, etag = _render_page(name)
+    else:
+        if name not in page_cache:
+            _render_pages()
+        body, etag = page_cache[name]
+    
+    headers = {
+        "ETag": etag,
+        # Revalidate on every load while developing
+        "Cache-Control": "no-cache" if settings.DEBUG else "public, max-age=300"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
 
 
-@app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Root endpoint - serve main page"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return _page_response(request, "index.html")
 
 
-@app.get("/registration", response_class=HTMLResponse)
 async def registration_page(request: Request):
     """Registration page"""
-    return templates.TemplateResponse("registration.html", {"request": request})
+    return _page_response(request, "registration.html")
 
 
-@app.get("/recognition", response_class=HTMLResponse)
 async def recognition_page(request: Request):
     """Recognition page"""
-    return templates.TemplateResponse("recognition.html", {"request": request})
+    return _page_response(request, "recognition.html")
 
 
-@app.get("/employees", response_class=HTMLResponse)
 async def employees_page(request: Request):
     """Employee list page"""
-    return templates.TemplateResponse("employees.html", {"request": request})
+    return _page_response(request, "employees.html")
+
+
+# Health check body never changes - serialized once
+HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "face-recognition-api"
+})
 
 
-@app.get("/api/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "face-recognition-api"
-    }
+    return Response(content=HEALTH_BODY, media_type="application/json")
 
 
-# Include routers
-app.include_router(employees.router, prefix=settings.API_V1_PREFIX)
-app.include_router(auto_registration.router, prefix=settings.API_V1_PREFIX)
-app.include_router(recognition.router, prefix=settings.API_V1_PREFIX)
-app.include_router(head_pose.router, prefix=settings.API_V1_PREFIX)
+# Create FastAPI app - pages, health check and static files are plain
+# Starlette routes (no dependency resolution or response model)
+app = FastAPI(
+    title=settings.PROJECT_NAME,
+    description="Face Recognition Attendance System with FastAPI",
+    version="1.0.0",
+    debug=settings.DEBUG,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+    routes=[
+        Route("/", root, methods=["GET"]),
+        Route("/registration", registration_page, methods=["GET"]),
+        Route("/recognition", recognition_page, methods=["GET"]),
+        Route("/employees", employees_page, methods=["GET"]),
+        Route("/api/health", health_check, methods=["GET"]),
+        Mount("/static", app=CachedStaticFiles(directory="app/static"), name="static")
+    ]
+)
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+    max_age=86400,  # browsers cache preflight responses for a day
+)
+
+# Compress HTML/JSON/static text responses (level 5 keeps CPU cost low)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+def _check_async_routes():
+    """
+    Fail startup if a route would be dispatched to the threadpool
+    
+    Sync endpoints and sync dependencies run through anyio's worker
+    threads on every request. Generator dependencies (get_db) are
+    allowed - their teardown blocks and belongs in the threadpool.
+    """
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None and not is_coroutine_callable(endpoint):
+            raise RuntimeError(f"Route {route.path} has a sync endpoint - make it async def")
+        
+        dependant = getattr(route, "dependant", None)
+        stack = list(dependant.dependencies) if dependant is not None else []
+        while stack:
+            dependency = stack.pop()
+            stack.extend(dependency.dependencies)
+            call = dependency.call
+            if call is None or is_coroutine_callable(call):
+                continue
+            if is_gen_callable(call) or is_async_gen_callable(call):
+                continue
+            raise RuntimeError(
+                f"Route {route.path} has a sync dependency {getattr(call, '__name__', call)!r}"
+            )
+
+
+# Pre-serialized error bodies (HTTPException and validation errors keep FastAPI's handlers)
+INTERNAL_ERROR_BODY = orjson.dumps({
+    "success": False,
+    "message": "Internal server error",
+    "detail": "An error occurred"
+})
+DATABASE_ERROR_BODY = orjson.dumps({
+    "success": False,
+    "message": "Database error",
+    "detail": "An error occurred"
+})
+
+
+@app.exception_handler(SQLAlchemyError)
+async def database_exception_handler(request, exc):
+    if settings.DEBUG:
+        logger.opt(exception=exc).error("Database error")
+        return ORJSONResponse(
+            status_code=500,
+            content={"success": False, "message": "Database error", "detail": str(exc)}
+        )
+    
+    logger.error("Database error: {}", type(exc).__name__)
+    return Response(content=DATABASE_ERROR_BODY, status_code=500, media_type="application/json")
 
 
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    logger.error(f"Global exception: {exc}")
-    return JSONResponse(
-        status_code=500,
-        content={
-            "success": False,
-            "message": "Internal server error",
-            "detail": str(exc) if settings.DEBUG else "An error occurred"
-        }
-    )
+    if settings.DEBUG:
+        logger.opt(exception=exc).error("Global exception")
+        return ORJSONResponse(
+            status_code=500,
+            content={"success": False, "message": "Internal server error", "detail": str(exc)}
+        )
+    
+    # No traceback formatting, str(exc) or serialization outside DEBUG;
+    # the message is only formatted by loguru if a sink accepts it
+    logger.error("Global exception: {}", type(exc).__name__)
+    return Response(content=INTERNAL_ERROR_BODY, status_code=500, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
     
+    # loop/http "auto" pick uvloop/httptools when installed (not on Windows)
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        workers=1 if settings.DEBUG else settings.WORKERS,
         log_level="info"
     )